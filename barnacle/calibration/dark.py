@@ -41,14 +41,23 @@ Example available in ``examples/run_dark.py``.
 """
 
 import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 import h5py
 import matplotlib.pyplot as plt
 import numpy as np
 from scipy.optimize import curve_fit
-from barnacle.glint_functions import gaussian_curve, get_channel_positions
+from barnacle.glint_functions import gaussian_curve, \
+    gaussian_curve_jacobian, get_channel_positions
+from numba import get_num_threads, njit, prange
 import barnacle.glint_classes as glint_classes
+from barnacle.tests.check_tools import check_datalist_not_empty
 
 NB_TRACKS = 16
+NB_WORKERS = 4  # Number of dark files read in parallel
+NB_FRAMES_PER_CHUNK = 1000  # Number of frames histogrammed at once
 
 
 def save_histo_dark(path, dic_data, mode='channel'):
@@ -89,25 +98,405 @@ def save_histo_dark(path, dic_data, mode='channel'):
             f.create_dataset('histogram', data=dic_data)
 
 
-def get_histogram(data, bins):
+def get_histogram_bins(edge_min, edge_max):
     """
-    Return the histogram of ``data`` according to the ``bins``.
+    Return the bins of the histograms of the dark.
 
-    :param data: data used to create the histogram,
-                 if dim>1, it is flattened
+    The bins are evenly spaced between ``edge_min-0.5`` and ``edge_max+0.5``.
+
+    :param edge_min: minimal value of the histograms.
+    :type edge_min: float
+    :param edge_max: maximal values of the histograms.
+    :type edge_max: float
+    :return: bin edges, including the rightmost one, and the width of the bins.
+    :rtype: tuple
+
+    """
+    bin_hist, step = np.linspace(
+        edge_min-0.5, edge_max+0.5, edge_max-edge_min+1, retstep=True)
+    return bin_hist, step
+
+
+def load_dark_arrays(path, nbimg=(0, 1)):
+    """
+    Load the frames of a dark file.
+
+    Lean counterpart of ``glint_classes.Null`` which only returns the
+    frames and their number, so that they can be freed as soon as a file is
+    processed.
+    Only the requested frames are read from ``.mat`` files, other formats
+    are loaded with ``glint_classes.File``.
+
+    :param path: path of the dark file.
+    :type path: string
+    :param nbimg: load the frames from the first to the second-1 element
+                    of the tuple, defaults to (0, 1) like
+                    ``glint_classes.File``.
+    :type nbimg: tuple, optional
+    :return: frames, structured as follow:
+                (frame, spatial axis, spectral axis),
+                and the number of frames.
+    :rtype: tuple
+
+    """
+    if '.mat' in path:
+        with h5py.File(path, 'r') as dataFile:
+            data = dataFile['imagedata'][nbimg[0]:nbimg[1]]
+        data = np.transpose(data, axes=(0, 2, 1))
+        return data, data.shape[0]
+
+    dark = glint_classes.File(path, nbimg)
+    return dark.data, dark.nbimg
+
+
+def get_data_dtype(dark_list):
+    """
+    Get a dtype which holds the frames of every dark file without loss.
+
+    Only the headers of the ``.mat`` files are read, any other format or an
+    empty list gives float64.
+
+    :param dark_list: list of the dark files.
+    :type dark_list: list
+    :return: common dtype of the frames.
+    :rtype: numpy dtype
+
+    """
+    if len(dark_list) == 0:
+        return np.dtype(np.float64)
+
+    dtypes = []
+    for path in dark_list:
+        if '.mat' not in path:
+            return np.dtype(np.float64)
+        with h5py.File(path, 'r') as dataFile:
+            dtypes.append(dataFile['imagedata'].dtype)
+    return np.result_type(*dtypes)
+
+
+def get_sum_dtype(dark_list):
+    """
+    Get the dtype in which the frames of the dark files are summed.
+
+    Detector counts are summed exactly in int64 if every file holds integers,
+    otherwise, or if there is no file, in float64.
+    Only the headers of the ``.mat`` files are read, any other format is
+    summed in float64.
+
+    :param dark_list: list of the dark files.
+    :type dark_list: list
+    :return: dtype of the sums.
+    :rtype: numpy dtype
+
+    """
+    if np.issubdtype(get_data_dtype(dark_list), np.integer):
+        return np.dtype(np.int64)
+    return np.dtype(np.float64)
+
+
+def _read_dark_file(path, channel_rows, sum_dtype, monitor):
+    """
+    Load a dark file and compute its contribution to the average dark.
+
+    The frames and the subframes of each channel are only returned if they
+    are monitored, otherwise they are freed as soon as they are summed.
+
+    :param path: path of the dark file.
+    :type path: string
+    :param channel_rows: rows of each channel, from ``get_channel_rows``.
+    :type channel_rows: 2D-array
+    :param sum_dtype: dtype of the sums, from ``get_sum_dtype``.
+    :type sum_dtype: numpy dtype
+    :param monitor: if ``True``, also return the frames and the subframes.
+    :type monitor: bool
+    :return: number of frames, sum of the frames, sum of the subframes of
+                each channel and, if ``monitor`` is ``True``, the frames
+                and the subframes of each channel.
+    :rtype: tuple
+
+    """
+    data, nbimg = load_dark_arrays(path)
+    sum_frame = data.sum(axis=0, dtype=sum_dtype)
+    sum_channel = get_channel_slices(sum_frame[None], channel_rows)[0]
+    if not monitor:
+        return nbimg, sum_frame, sum_channel
+
+    slices = get_channel_slices(data, channel_rows)
+    return nbimg, sum_frame, sum_channel, data, slices
+
+
+def _iter_dark_files(dark_list, channel_rows, sum_dtype, monitor,
+                     nb_workers):
+    """
+    Yield the output of ``_read_dark_file`` for each file, in order.
+
+    The files are read by a pool of threads, up to ``nb_workers`` files
+    ahead of the one being processed, hence up to ``nb_workers+1`` files
+    are in memory.
+    If ``monitor`` is ``True``, each of them holds its frames and a copy of
+    its channels, i.e. about twice the size of the file, instead of only
+    its sums.
+    The files which are not read yet are dropped if the generator is closed
+    early.
+
+    :param dark_list: list of the dark files to read.
+    :type dark_list: list
+    :param channel_rows: rows of each channel, from ``get_channel_rows``.
+    :type channel_rows: 2D-array
+    :param sum_dtype: dtype of the sums, from ``get_sum_dtype``.
+    :type sum_dtype: numpy dtype
+    :param monitor: if ``True``, the frames and the subframes are returned.
+    :type monitor: bool
+    :param nb_workers: number of threads.
+    :type nb_workers: int
+    :return: generator of the outputs of ``_read_dark_file``.
+    :rtype: generator
+
+    """
+    with ThreadPoolExecutor(nb_workers) as pool:
+        pending = deque()
+        try:
+            for f in dark_list:
+                pending.append(pool.submit(
+                    _read_dark_file, f, channel_rows, sum_dtype, monitor))
+                if len(pending) == nb_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def get_channel_rows(channel_pos, sep):
+    """
+    Get the rows of pixels covered by each channel.
+
+    The bounds are the same as in ``glint_classes.Null.getChannels``.
+
+    :param channel_pos: position of the channels.
+    :type channel_pos: list-like
+    :param sep: gap between the channels, in pixel.
+    :type sep: float
+    :return: rows of each channel, of shape (channel ID, spatial axis).
+    :rtype: 2D-array
+
+    """
+    return np.array([np.arange(int(np.around(pos-sep/2)),
+                               int(np.around(pos+sep/2)))
+                     for pos in channel_pos])
+
+
+def get_channel_slices(data, channel_rows):
+    """
+    Extract the channels from the frames.
+
+    :param data: frames, structured as follow:
+                    (frame, spatial axis, spectral axis)
+    :type data: 3D-array
+    :param channel_rows: rows of each channel, from ``get_channel_rows``.
+    :type channel_rows: 2D-array
+    :return: subframes of each channel, structured as follow:
+                (frame, spectral axis, channel ID, spatial axis)
+    :rtype: 4D-array
+
+    """
+    # Taking the rows along the last axis gives C-contiguous subframes
+    return np.take(data.transpose(0, 2, 1), channel_rows, axis=2)
+
+
+def bin_frames(data, binning):
+    """
+    Average ``data`` over blocks of ``binning`` consecutive frames.
+
+    The last block holds the remaining frames if the number of frames is
+    not a multiple of ``binning``, the number of frames per block is
+    returned to weight it accordingly.
+
+    :param data: data to bin along its first axis.
     :type data: array
-    :param bins: left bin edges of the histogram.
-        The last element is the right edge of the last bin.
+    :param binning: number of frames per block.
+    :type binning: int
+    :return: binned data and the number of frames of each block.
+    :rtype: tuple
+
+    """
+    idx = np.arange(0, data.shape[0], binning)
+    nb_per_block = np.diff(np.append(idx, data.shape[0]))
+    binned = np.add.reduceat(data, idx, axis=0)
+    binned = binned / np.reshape(nb_per_block, (-1,) + (1,) * (data.ndim - 1))
+    return binned, nb_per_block
+
+
+def fit_gaussian_histogram(bin_cent, histo, p0):
+    """
+    Fit a Gaussian curve on a histogram.
+
+    The logarithm of a Gaussian curve is a parabola: a linear least squares
+    fit of a 2nd order polynomial on the logarithm of the non-empty bins
+    gives the parameters of the Gaussian without any iteration.
+    Each bin is weighted by its count as the variance of the logarithm
+    of a Poisson-distributed count is inversely proportional to it.
+    If the fitted parabola is not concave, the fit is done with
+    ``scipy.optimize.curve_fit`` instead, with the analytic Jacobian of the
+    Gaussian curve.
+
+    :param bin_cent: centre of the bins of the histogram.
+    :type bin_cent: array
+    :param histo: histogram to fit.
+    :type histo: array
+    :param p0: initial guess of the amplitude, location and scale of the
+                Gaussian, used by ``curve_fit``.
+    :type p0: list-like
+    :return: amplitude, location and scale of the Gaussian curve.
+    :rtype: array
+
+    """
+    mask = histo > 0
+    x, y = bin_cent[mask], histo[mask]
+    if x.size >= 3:
+        # Centre the abscissa to keep the system well conditioned
+        x0 = np.average(x, weights=y)
+        weights = np.sqrt(y)
+        c2, c1, c0 = np.linalg.lstsq(np.vander(x - x0, 3) * weights[:, None],
+                                     np.log(y) * weights, rcond=None)[0]
+        if c2 < 0:
+            sig = np.sqrt(-1 / (2 * c2))
+            loc = c1 * sig**2
+            A = np.exp(c0 + loc**2 / (2 * sig**2))
+            return np.array([A, x0 + loc, sig])
+
+    popt, pcov = curve_fit(gaussian_curve, bin_cent, histo, p0=p0,
+                           method='lm', jac=gaussian_curve_jacobian)
+    return popt
+
+
+@njit(nogil=True)
+def _bin_index(value, bins):
+    """
+    Numba-ized function returning the index of the bin containing ``value``.
+
+    The bins must be evenly spaced.
+    The rounding errors are corrected like in ``np.histogram``.
+
+    :param value: value to bin.
+    :type value: float
+    :param bins: bin edges of the histogram, including the rightmost edge.
+    :type bins: array
+    :return: index of the bin, -1 if ``value`` is outside the bins.
+    :rtype: int
+
+    """
+    nbins = bins.size - 1
+    first_edge, last_edge = bins[0], bins[-1]
+    if not (first_edge <= value <= last_edge):
+        return -1
+    b = int((value - first_edge) * nbins / (last_edge - first_edge))
+    if b == nbins:
+        b -= 1
+    if value < bins[b]:
+        b -= 1
+    elif b != nbins - 1 and value >= bins[b+1]:
+        b += 1
+    return b
+
+
+@njit(parallel=True, nogil=True)
+def _histogram_frames(data, offsets, bins):
+    """
+    Numba-ized function computing the histogram of the frames, once the
+    offset of each frame is removed.
+
+    The offsets are subtracted value by value so that no offset-corrected
+    copy of ``data`` is created.
+    The rows of all the frames are split in as many blocks as threads, so
+    that even a single frame is shared between the threads, each block
+    filling its own histogram which are summed at the end.
+    The bins must be evenly spaced, values outside them are ignored like
+    in ``np.histogram``.
+
+    :param data: frames, structured as follow:
+                    (frame, spatial axis, spectral axis)
+    :type data: 3D-array
+    :param offsets: offset of each frame.
+    :type offsets: 1D-array
+    :param bins: bin edges of the histogram, including the rightmost edge.
     :type bins: array
     :return: Non-normalized histogram.
     :rtype: array
 
     """
-    if len(data.shape) != 1:
-        data = np.ravel(data)
+    nb_frames, nb_rows, nb_cols = data.shape
+    nbins = bins.size - 1
+
+    nb_lines = nb_frames * nb_rows
+    nb_blocks = max(1, min(get_num_threads(), nb_lines))
+    block_size = (nb_lines + nb_blocks - 1) // nb_blocks
+    histo = np.zeros((nb_blocks, nbins), dtype=np.int64)
+
+    for i in prange(nb_blocks):
+        for j in range(i*block_size, min((i+1)*block_size, nb_lines)):
+            f, y = j // nb_rows, j % nb_rows
+            for x in range(nb_cols):
+                b = _bin_index(data[f, y, x] - offsets[f], bins)
+                if b >= 0:
+                    histo[i, b] += 1
+
+    return histo.sum(axis=0)
+
+
+@njit(parallel=True, nogil=True)
+def _histogram_channels(slices, dark, bins):
+    """
+    Numba-ized function computing the histogram and the average of each
+    channel, once the dark is removed.
+
+    The dark is subtracted value by value so that no dark-corrected copy
+    of ``slices`` is created.
+    Each frame is read once, in memory order if ``slices`` is C-contiguous,
+    and its averages are written once it is processed.
+    The frames are split in as many blocks as threads, hence it must be
+    called on many frames at once to run in parallel, each block filling
+    its own histograms which are summed at the end.
+    The bins must be evenly spaced, values outside them are ignored like
+    in ``np.histogram``.
+
+    :param slices: subframes of each channel, structured as follow:
+                    (frame, spectral axis, channel ID, spatial axis)
+    :type slices: 4D-array
+    :param dark: average dark per channel.
+    :type dark: 3D-array
+    :param bins: bin edges of the histogram, including the rightmost edge.
+    :type bins: array
+    :return: Non-normalized histogram of each channel and the average of
+                each channel per frame.
+    :rtype: tuple
 
-    histo = np.histogram(np.ravel(data), bins=bins)[0]
-    return histo
+    """
+    nb_frames, nb_rows, nb_tracks, nb_cols = slices.shape
+    nbins = bins.size - 1
+
+    nb_blocks = max(1, min(get_num_threads(), nb_frames))
+    block_size = (nb_frames + nb_blocks - 1) // nb_blocks
+    histo = np.zeros((nb_blocks, nb_tracks, nbins), dtype=np.int64)
+    average = np.empty((nb_frames, nb_tracks))
+
+    for i in prange(nb_blocks):
+        # Sums of the current frame, kept local to the block
+        frame_sum = np.empty(nb_tracks)
+        for f in range(i*block_size, min((i+1)*block_size, nb_frames)):
+            frame_sum[:] = 0.
+            for y in range(nb_rows):
+                for k in range(nb_tracks):
+                    for x in range(nb_cols):
+                        value = slices[f, y, k, x] - dark[y, k, x]
+                        frame_sum[k] += value
+                        b = _bin_index(value, bins)
+                        if b >= 0:
+                            histo[i, k, b] += 1
+            average[f] = frame_sum / (nb_rows * nb_cols)
+
+    return histo.sum(axis=0), average
 
 
 def get_average_dark(data_path, output_path, nb_files, save, monitor, edges, keyword):
@@ -142,45 +531,90 @@ def get_average_dark(data_path, output_path, nb_files, save, monitor, edges, key
 
     ''' Define bounds of each track '''
     channel_pos, sep = get_channel_positions(NB_TRACKS)
+    channel_rows = get_channel_rows(channel_pos, sep)
 
     ''' Computing average dark '''
-    super_dark = np.zeros((344, 96))
-    super_dark_channel = np.zeros((96, 16, 20))
+    # Detector counts are summed exactly in int64,
+    # until the division by the number of frames
+    sum_dtype = get_sum_dtype(dark_list)
+    super_dark = np.zeros((344, 96), dtype=sum_dtype)
+    super_dark_channel = np.zeros((96, 16, 20), dtype=sum_dtype)
     nb_img = 0.
 
-    for f in dark_list[:]:
-        print("Process of : %s (%d / %d)" %
-              (f, dark_list.index(f)+1, len(dark_list)))
-        dark = glint_classes.Null(f)
-
-        super_dark = super_dark + dark.data.sum(axis=0)
-        nb_img = nb_img + dark.nbimg
-
-        spatial_axis = np.arange(dark.data.shape[0])
-        dark.getChannels(channel_pos, sep, spatial_axis)
-
-        super_dark_channel = super_dark_channel + dark.slices.sum(axis=0)
+    if monitor:
+        # Nothing to monitor without any frame
+        check_datalist_not_empty(dark_list)
+        bin_hist = get_histogram_bins(edge_min, edge_max)[0]
+        avg_dark = []
+        list_hist = []
+        nb_frames = []
+    # The channels are buffered on disk so that they can be monitored
+    # without reading and decoding the dark files again, in a dtype
+    # chosen beforehand as the files may hold different dtypes
+    scratch_dtype = get_data_dtype(dark_list)
+    if monitor:
+        # Unique file on the local temporary storage, so that concurrent
+        # runs and existing files of output_path are left untouched
+        scratch_fd, scratch_path = tempfile.mkstemp(
+            prefix='barnacle_dark_', suffix='.dat')
+
+    # The files are read and summed in threads, the histograms are made here
+    # as numba parallel kernels cannot be launched from several threads
+    dark_files = _iter_dark_files(dark_list, channel_rows, sum_dtype, monitor,
+                                  NB_WORKERS)
+
+    try:
+        with os.fdopen(scratch_fd, 'wb') if monitor else nullcontext() \
+                as scratch:
+            for idx, dark_file in enumerate(dark_files):
+                print("Process of : %s (%d / %d)" %
+                      (dark_list[idx], idx+1, len(dark_list)))
+                nbimg, sum_frame, sum_channel = dark_file[:3]
+
+                super_dark += sum_frame
+                nb_img = nb_img + nbimg
+                super_dark_channel += sum_channel
+
+                if monitor:
+                    data, slices = dark_file[3:]
+                    frame_mean = data.mean(axis=(1, 2))
+                    avg_dark.append(frame_mean[:, None])
+                    list_hist.append(
+                        _histogram_frames(data, frame_mean, bin_hist))
+                    slices.astype(scratch_dtype, copy=False).tofile(scratch)
+                    nb_frames.append(nbimg)
+                    del data, slices
+
+                # Free the frames of this file, only the files being read
+                # by the threads are kept in memory
+                del dark_file
+
+        if nb_img != 0.:
+            super_dark = super_dark / nb_img
+            super_dark_channel = super_dark_channel / nb_img
+            if save:
+                np.save(output_path+'superdark', super_dark)
+                np.save(output_path+'superdarkchannel', super_dark_channel)
 
         if monitor:
+            avg_dark = np.concatenate(avg_dark, axis=0)
+            dark_slices = np.memmap(
+                scratch_path, dtype=scratch_dtype, mode='r',
+                shape=(sum(nb_frames), super_dark.shape[1]) +
+                channel_rows.shape)
             try:
-                avg_dark = np.vstack((avg_dark, np.reshape(
-                    dark.data.mean(axis=(1, 2)), (-1, 1))))
-            except NameError:
-                print('except')
-                avg_dark = np.reshape(dark.data.mean(axis=(1, 2)), (-1, 1))
-
-    if nb_img != 0.:
-        super_dark /= nb_img
-        super_dark_channel = super_dark_channel / nb_img
-        if save:
-            np.save(output_path+'superdark', super_dark)
-            np.save(output_path+'superdarkchannel', super_dark_channel)
-
-    if monitor:
-        params, hist_channels, hist_global = \
-            check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis,
-                       edge_min, edge_max, super_dark_channel, save,
-                       output_path)
+                params, hist_channels, hist_global = \
+                    check_dark(dark_slices, avg_dark, list_hist, edge_min,
+                               edge_max, super_dark_channel, save,
+                               output_path)
+            finally:
+                # The memmap must be closed before removing its file
+                del dark_slices
+    finally:
+        # Stop the threads if the loop was interrupted
+        dark_files.close()
+        if monitor and os.path.exists(scratch_path):
+            os.remove(scratch_path)
 
     if monitor:
         return super_dark, super_dark_channel,\
@@ -189,23 +623,25 @@ def get_average_dark(data_path, output_path, nb_files, save, monitor, edges, key
         return super_dark, super_dark_channel
 
 
-def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
-               edge_max, super_dark_channel, save, output_path):
+def check_dark(dark_slices, avg_dark, list_hist, edge_min, edge_max,
+               super_dark_channel, save, output_path):
     """
     Plot histograms and timelapse to control the dark.
 
     One can detect drifts, bad pixels, electronic anomalies, etc.
 
-    :param dark_list: list of the dark files to process.
-    :type dark_list: list
+    The saved figures are closed once written, the other ones are left open
+    to be displayed.
+
+    :param dark_slices: channels of all the frames of the dark files,
+                        structured as follow:
+                        (frame, spectral axis, channel ID, spatial axis)
+    :type dark_slices: 4D-array
     :param avg_dark: average dark of the whole frame.
     :type avg_dark: 2D-array
-    :param channel_pos: position of the 16 channels.
-    :type channel_pos: list-like
-    :param sep: gap between the channels, in pixel.
-    :type sep: float
-    :param spatial_axis: y-axis of the frame.
-    :type spatial_axis: array-like
+    :param list_hist: histogram of the dark on the whole frame,
+                        for each dark file.
+    :type list_hist: list
     :param edge_min: minimal value of the histograms.
     :type edge_min: float
     :param edge_max: maximal values of the histograms.
@@ -219,48 +655,33 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
     :rtype: tuple
 
     """
-    bin_hist, step = np.linspace(
-        edge_min-0.5, edge_max+0.5, edge_max-edge_min+1, retstep=True)
+    bin_hist, step = get_histogram_bins(edge_min, edge_max)
     bin_hist_cent = bin_hist[:-1] + step/2
     hist_slices = []
-    list_hist = []
-
-    for f in dark_list:
-        print("Histogram of : %s (%d / %d)" %
-              (f, dark_list.index(f)+1, len(dark_list)))
-        dark = glint_classes.Null(f)
-        spatial_axis = np.arange(dark.data.shape[0])
-        hist = np.histogram(np.ravel(
-            dark.data - dark.data.mean(axis=(1, 2))[:, None, None]),
-            bins=bin_hist)
-        list_hist.append(hist[0])
-
-        dark.getChannels(channel_pos, sep, spatial_axis)
-        dark.slices = dark.slices - super_dark_channel
-
-        try:
-            dark_current = np.vstack(
-                (dark_current, dark.slices.mean(axis=(1, 3))))
-            dk56 = np.vstack(
-                (dk56, np.reshape(dark.slices[:, 56, 15, :].mean(axis=-1),
-                                  (-1, 1))))
-            dk56bis = np.vstack(
-                (dk56, np.reshape(dark.slices[:, 56, 15, 10].mean(axis=-1),
-                                  (-1, 1))))
-        except NameError:
-            print('except 2')
-            dark_current = dark.slices.mean(axis=(1, 3))
-            dk56 = np.reshape(
-                dark.slices[:, 56, 15, :].mean(axis=-1), (-1, 1))
-            dk56bis = np.reshape(
-                dark.slices[:, 56, 15, 10].mean(axis=-1), (-1, 1))
-
-        histo_per_file = []
-        for k in range(16):
-            histo_per_file.append(get_histogram(
-                np.ravel(dark.slices[:, :, k, :]), bin_hist))
-        hist_slices.append(histo_per_file)
-
+    dark_current = []
+    dk56 = []
+    dk56bis = []
+
+    # The frames are histogrammed by chunks spanning several files, so that
+    # the numba kernel has enough frames to share between its threads
+    nb_frames = dark_slices.shape[0]
+    for first_frame in range(0, nb_frames, NB_FRAMES_PER_CHUNK):
+        last_frame = min(first_frame + NB_FRAMES_PER_CHUNK, nb_frames)
+        print("Histogram of frames %d to %d / %d" %
+              (first_frame+1, last_frame, nb_frames))
+        slices = np.asarray(dark_slices[first_frame:last_frame])
+
+        histo_per_chunk, dark_current_per_chunk = \
+            _histogram_channels(slices, super_dark_channel, bin_hist)
+        hist_slices.append(histo_per_chunk)
+        dark_current.append(dark_current_per_chunk)
+        dk56.append((slices[:, 56, 15, :] -
+                     super_dark_channel[56, 15]).mean(axis=-1))
+        dk56bis.append(slices[:, 56, 15, 10] - super_dark_channel[56, 15, 10])
+
+    dark_current = np.concatenate(dark_current, axis=0)
+    dk56 = np.concatenate(dk56)[:, None]
+    dk56bis = np.concatenate(dk56bis)[:, None]
     list_hist = np.array(list_hist)
     hist_slices = np.array(hist_slices)
     super_hist = np.sum(hist_slices, axis=0)
@@ -271,11 +692,11 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
 
     params = []
     for i in range(16):
-        popt, pcov = curve_fit(gaussian_curve, bin_hist_cent,
-                               super_hist[i],
-                               p0=[max(super_hist[i]), 0., 50])
+        popt = fit_gaussian_histogram(bin_hist_cent, super_hist[i],
+                                      p0=[max(super_hist[i]), 0., 50])
         params.append(popt)
     params = np.array(params)
+    fits = np.array([gaussian_curve(bin_hist_cent, *popt) for popt in params])
 
     hist_to_save = np.empty((super_hist.shape[0], super_hist.shape[1], 2))
     hist_to_save[:, :, 0] = super_hist
@@ -287,8 +708,8 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
         save_histo_dark(output_path+'hist_dk.hdf5',
                         np.array([list_hist, bin_hist[:-1]]), 'global')
 
-    popt, pcov = curve_fit(gaussian_curve, bin_hist_cent, list_hist, p0=[
-                           max(list_hist), 0, 50])
+    popt = fit_gaussian_histogram(bin_hist_cent, list_hist,
+                                  p0=[max(list_hist), 0, 50])
     f = plt.figure(figsize=(19.20, 10.80))
     ax = f.add_subplot(111)
     plt.plot(bin_hist_cent, list_hist, lw=5)
@@ -306,15 +727,15 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
              bbox=dict(boxstyle="square", facecolor='white'))
     if save:
         plt.savefig(output_path+'histogram_dark_fullframe.png')
+        plt.close(f)
 
-    plt.figure(figsize=(19.20, 10.80))
+    f = plt.figure(figsize=(19.20, 10.80))
     for i in range(16):
         lab = r'$\mu = $%.3f' % params[i, 1] + \
             '\n'+r'$\sigma = $%.3f' % params[i, 2]
         plt.subplot(4, 4, i+1)
         plt.plot(bin_hist_cent, super_hist[i])
-        plt.plot(bin_hist_cent, gaussian_curve(
-            bin_hist_cent, *params[i]), label=lab)
+        plt.plot(bin_hist_cent, fits[i], label=lab)
         plt.grid()
         plt.xlabel('Dark current (ADU)')
         plt.ylabel('Count')
@@ -323,15 +744,15 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
     plt.suptitle('Histogram of the background noise')
     if save:
         plt.savefig(output_path+'histogram_dark.png')
+        plt.close(f)
 
-    plt.figure(figsize=(19.20, 10.80))
+    f = plt.figure(figsize=(19.20, 10.80))
     for i in range(16):
         lab = r'$\mu = $%.3f' % params[i, 1] + \
             '\n'+r'$\sigma = $%.3f' % params[i, 2]
         plt.subplot(4, 4, i+1)
         plt.semilogy(bin_hist_cent, super_hist[i])
-        plt.semilogy(bin_hist_cent, gaussian_curve(
-            bin_hist_cent, *params[i]), label=lab)
+        plt.semilogy(bin_hist_cent, fits[i], label=lab)
         plt.grid()
         plt.xlabel('Dark current (ADU)')
         plt.ylabel('Count')
@@ -342,15 +763,16 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
     plt.suptitle('Histogram of the background noise')
     if save:
         plt.savefig(output_path+'histogram_dark_logscale.png')
+        plt.close(f)
 
     ''' Inspecting non-uniformities '''
     hist_dk56, bin_dk56 = np.histogram(dk56, bins=int(len(dk56)**0.5))
     bin_dk56_cent = bin_dk56[:-1] + np.diff(bin_dk56)/2
     hist_dk56 = hist_dk56 / np.sum(hist_dk56)
 
-    popt, pcov = curve_fit(gaussian_curve, bin_dk56_cent, hist_dk56,
-                           p0=[max(hist_dk56), dk56.mean(),
-                               dk56.std()])
+    popt = fit_gaussian_histogram(bin_dk56_cent, hist_dk56,
+                                  p0=[max(hist_dk56), dk56.mean(),
+                                      dk56.std()])
     f = plt.figure(figsize=(19.20, 10.80))
     ax = f.add_subplot(111)
     plt.title(
@@ -375,10 +797,9 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
     bin_dk56bis_cent = bin_dk56bis[:-1] + np.diff(bin_dk56bis)/2
     hist_dk56bis = hist_dk56bis / np.sum(hist_dk56bis)
 
-    popt, pcov = curve_fit(gaussian_curve, bin_dk56bis_cent,
-                           hist_dk56bis,
-                           p0=[max(hist_dk56bis), dk56bis.mean(),
-                               dk56bis.std()])
+    popt = fit_gaussian_histogram(bin_dk56bis_cent, hist_dk56bis,
+                                  p0=[max(hist_dk56bis),
+                                      dk56bis.mean(), dk56bis.std()])
     f = plt.figure(figsize=(19.20, 10.80))
     ax = f.add_subplot(111)
     plt.title(
@@ -400,31 +821,32 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
              transform=ax.transAxes, bbox=dict(boxstyle="square",
                                                facecolor='white'))
 
-    plt.figure(figsize=(19.20, 10.80))
+    time = np.arange(dark_current.shape[0])
+    binning = 10
+    time_binned, nb_per_block = bin_frames(time, binning)
+    dark_current_binned = bin_frames(dark_current, binning)[0]
+    # Linear fit of the drift of all the tracks at once,
+    # popts[:, i] is the slope and the intercept of the i-th track.
+    # The blocks are weighted by the square root of their number of frames
+    # so that a short last block counts less
+    weights = np.sqrt(nb_per_block)[:, None]
+    popts = np.linalg.lstsq(np.vander(time_binned, 2) * weights,
+                            dark_current_binned * weights, rcond=None)[0]
+
+    f = plt.figure(figsize=(19.20, 10.80))
     for i in range(16):
-        time = np.arange(dark_current.shape[0])
-        shape = dark_current.shape
-        binning = 10
-        new_shape = int(shape[0]//binning*binning)
-        time_binned = np.reshape(
-            time[:new_shape], (int(new_shape/binning), binning))
-        time_binned = np.mean(time_binned, axis=1)
-        dark_current_binned = np.reshape(
-            dark_current[:new_shape, i], (int(new_shape/binning),
-                                          binning))
-        dark_current_binned = np.mean(dark_current_binned, axis=1)
-        print(dark_current_binned.mean(), dark_current_binned.std())
-        popt = np.polyfit(time_binned, dark_current_binned, 1)
-        p = np.poly1d(popt)
+        print(dark_current_binned[:, i].mean(),
+              dark_current_binned[:, i].std())
+        p = np.poly1d(popts[:, i])
         plt.subplot(4, 4, i+1)
         plt.plot(time[::500], dark_current[::500, i],
                  alpha=0.5, label='Data (subsampled)')
-        plt.plot(time_binned, dark_current_binned,
+        plt.plot(time_binned, dark_current_binned[:, i],
                  label='Binned data (%s)' % binning)
         plt.plot(time[::500], p(time[::500]), label='Fit')
         plt.grid()
         plt.ylim(-4.5, 4.5)
-        plt.title('Track %s (Drift = %.3E/frame)' % (i+1, popt[0]))
+        plt.title('Track %s (Drift = %.3E/frame)' % (i+1, popts[0, i]))
         plt.xlabel('Frame')
         plt.ylabel('Avg dark current')
         if i == 0:
@@ -432,6 +854,7 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
     plt.tight_layout()
     if save:
         plt.savefig(output_path+'avg_time_lapse.png')
+        plt.close(f)
 
     plt.figure(figsize=(19.20, 10.80))
     plt.plot(np.arange(dk56.size)[::1], dk56[::1])
@@ -454,17 +877,13 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
         'Dark current at center of P1 at 56th column of pixels',
         size=35)
 
-    plt.figure(figsize=(19.20, 10.80))
+    f = plt.figure(figsize=(19.20, 10.80))
     avg_dark = np.reshape(avg_dark, (-1,))
     time = np.arange(avg_dark.size)
-    shape = avg_dark.shape
     binning = 10
-    new_shape = int(shape[0]//binning*binning)
-    time_binned = np.reshape(time[:new_shape], (-1, binning))
-    avg_dark_binned = np.reshape(avg_dark[:new_shape], (-1, binning))
-    time_binned = np.mean(time_binned, axis=1)
-    avg_dark_binned = np.mean(avg_dark_binned, axis=1)
-    popt = np.polyfit(time_binned, avg_dark_binned, 1)
+    time_binned, nb_per_block = bin_frames(time, binning)
+    avg_dark_binned = bin_frames(avg_dark, binning)[0]
+    popt = np.polyfit(time_binned, avg_dark_binned, 1, w=np.sqrt(nb_per_block))
     p = np.poly1d(popt)
     plt.plot(time[::1], avg_dark[::1], lw=3, alpha=0.5, label='Data')
     plt.plot(time_binned, avg_dark_binned, lw=3,
@@ -481,5 +900,6 @@ def check_dark(dark_list, avg_dark, channel_pos, sep, spatial_axis, edge_min,
     plt.legend(loc='best')
     if save:
         plt.savefig(output_path+'avg_dark_fullframe.png')
+        plt.close(f)
 
     return params, hist_to_save, np.array([list_hist, bin_hist[:-1]])
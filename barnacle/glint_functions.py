@@ -30,6 +30,31 @@ def gaussian_curve(x, A, loc, sig):
     return A * np.exp(-(x-loc)**2/(2*sig**2))
 
 
+def gaussian_curve_jacobian(x, A, loc, sig):
+    """
+    Computes the Jacobian of ``gaussian_curve`` with respect to its parameters
+
+    :Parameters:
+
+        **x**: values where the curve is estimated.
+
+        **A**: amplitude of the Gaussian.
+
+        **loc**: location of the Gaussian.
+
+        **sig**: scale of the Gaussian.
+
+    :Returns:
+
+        Partial derivatives with respect to ``A``, ``loc`` and ``sig``,\
+        of shape (len(x), 3).
+    """
+    gaus = np.exp(-(x-loc)**2/(2*sig**2))
+    return np.stack([gaus,
+                     A * gaus * (x-loc)/sig**2,
+                     A * gaus * (x-loc)**2/sig**3], axis=1)
+
+
 def norm_gaussian_with_linear_curve(x, A, B, C, loc, sig):
     """
     Computes a gaussian curve
@@ -0,0 +1,127 @@
+"""
+Check that the numba histogram kernels of ``dark.py`` bin the values exactly
+like ``np.histogram`` and that the Gaussian fit of the histograms matches
+``curve_fit``.
+"""
+import numpy as np
+from numba import get_num_threads
+from scipy.optimize import curve_fit
+import barnacle.calibration.dark as dark
+from barnacle.calibration.dark import fit_gaussian_histogram, \
+    get_histogram_bins, _histogram_channels, _histogram_frames
+from barnacle.glint_functions import gaussian_curve, gaussian_curve_jacobian
+
+
+def make_values(shape, bins, seed=0):
+    """
+    Create random values including the bin edges and values outside them.
+
+    :param shape: shape of the array to create.
+    :type shape: tuple
+    :param bins: bin edges of the histogram.
+    :type bins: array
+    :return: random values.
+    :rtype: array
+
+    """
+    rng = np.random.default_rng(seed)
+    values = rng.normal(0., 200., size=shape).round(1)
+    flat = values.reshape(-1)
+    edges = np.concatenate((bins, [bins[0] - 1., bins[-1] + 1.]))
+    flat[:edges.size] = edges
+    return values
+
+
+def test_histogram_frames():
+    bins = get_histogram_bins(-500, 500)[0]
+    # Number of frames not evenly split between the threads
+    nb_frames = 2 * get_num_threads() + 1
+    data = make_values((nb_frames, 344, 96), bins)
+    # No offset on the 1st frame, which holds the edge values
+    offsets = np.linspace(0., 3., nb_frames)
+
+    histo = _histogram_frames(data, offsets, bins)
+    expected = np.histogram(data - offsets[:, None, None], bins)[0]
+    assert np.array_equal(histo, expected)
+
+    # A single frame, as read from a dark file, is split between the threads
+    histo = _histogram_frames(data[:1], offsets[:1], bins)
+    assert np.array_equal(histo, np.histogram(data[0], bins)[0])
+
+
+def test_histogram_channels():
+    bins = get_histogram_bins(-500, 500)[0]
+    nb_frames = 2 * get_num_threads() + 1
+    slices = make_values((nb_frames, 96, 16, 20), bins)
+    dark = make_values((96, 16, 20), bins, seed=1) / 100.
+
+    histo, average = _histogram_channels(slices, np.zeros_like(dark), bins)
+    expected = [np.histogram(slices[:, :, k, :], bins)[0] for k in range(16)]
+    assert np.array_equal(histo, expected)
+
+    histo, average = _histogram_channels(slices, dark, bins)
+    corrected = slices - dark
+    expected = [np.histogram(corrected[:, :, k, :], bins)[0]
+                for k in range(16)]
+    assert np.array_equal(histo, expected)
+    assert np.allclose(average, corrected.mean(axis=(1, 3)))
+
+
+def test_fit_gaussian_histogram():
+    bins, step = get_histogram_bins(-500, 500)
+    bin_cent = bins[:-1] + step/2
+
+    # Noiseless Gaussian histogram, with empty bins in the tails
+    histo = np.round(gaussian_curve(bin_cent, 1e4, 12.3, 45.6))
+    popt = fit_gaussian_histogram(bin_cent, histo, p0=[histo.max(), 0., 50])
+    assert np.allclose(popt, [1e4, 12.3, 45.6], rtol=1e-3)
+
+    rng = np.random.default_rng(0)
+    histo = np.histogram(rng.normal(3., 20., 100000), bins)[0] / 100000
+    p0 = [histo.max(), 0., 50]
+    popt = fit_gaussian_histogram(bin_cent, histo, p0=p0)
+    expected = curve_fit(gaussian_curve, bin_cent, histo, p0=p0)[0]
+    assert np.allclose(popt[[0, 2]], expected[[0, 2]], rtol=1e-2)
+    # Locations within the standard error of the mean of the samples
+    assert abs(popt[1] - expected[1]) < 20. / np.sqrt(100000)
+
+
+def test_fit_gaussian_histogram_fallback(monkeypatch):
+    calls = []
+
+    def spy(*args, **kwargs):
+        calls.append(kwargs)
+        return np.array([1., 2., 3.]), np.eye(3)
+
+    monkeypatch.setattr(dark, 'curve_fit', spy)
+    bin_cent = np.linspace(-10., 10., 21)
+    p0 = [1., 0., 5.]
+
+    # The logarithm of this histogram is convex, no concave parabola fits it
+    histo = 1 + (bin_cent / 10)**2
+    assert np.array_equal(fit_gaussian_histogram(bin_cent, histo, p0),
+                          [1., 2., 3.])
+    # Too few non-empty bins to fit a parabola
+    histo = np.zeros_like(bin_cent)
+    histo[10:12] = 1.
+    fit_gaussian_histogram(bin_cent, histo, p0)
+
+    assert len(calls) == 2
+    for kwargs in calls:
+        assert kwargs['p0'] == p0
+        assert kwargs['method'] == 'lm'
+        assert kwargs['jac'] is gaussian_curve_jacobian
+
+
+def test_gaussian_curve_jacobian():
+    x = np.linspace(-10., 10., 21)
+    params = np.array([2., 1.5, 3.])
+    jac = gaussian_curve_jacobian(x, *params)
+
+    eps = 1e-6
+    for i in range(3):
+        dp = np.zeros(3)
+        dp[i] = eps
+        expected = (gaussian_curve(x, *(params + dp)) -
+                    gaussian_curve(x, *(params - dp))) / (2 * eps)
+        assert np.allclose(jac[:, i], expected, atol=1e-8)